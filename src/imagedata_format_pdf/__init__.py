@@ -1,9 +1,9 @@
 """imagedata_format_pdf"""
 
+import functools
 import logging
-import os
 from os.path import join, exists
-import subprocess
+import shutil
 
 logging.getLogger(__name__).addHandler(logging.NullHandler())
 
@@ -33,10 +33,11 @@ except (Exception, PackageNotFoundError):
 __author__ = 'Erling Andersen, Haukeland University Hospital, Bergen, Norway'
 __email__ = 'Erling.Andersen@Helse-Bergen.NO'
 
-try:
-    subprocess.call(
-        ["pdfinfo", "-h"], stdout=open(os.devnull, "w"), stderr=open(os.devnull, "w")
-    )
-    POPPLER_INSTALLED = True
-except OSError as e:
-    POPPLER_INSTALLED = e.errno != errno.ENOENT
+
+@functools.lru_cache(maxsize=None)
+def poppler_installed():
+    """Return True when the poppler utilities are found.
+
+    The check is done on first use only, and the result is cached.
+    """
+    return shutil.which("pdfinfo") is not None
@@ -4,24 +4,32 @@
 # Copyright (c) 2022 Erling Andersen, Haukeland University Hospital,
 # Bergen, Norway
 
-import os.path
-import locale
+import os
 import logging
-import magic
 import tempfile
 import numpy as np
-import pydicom
 from pydicom.dataset import Dataset, FileDataset
 from pydicom.sequence import Sequence
 import datetime
-from pdf2image import convert_from_bytes, convert_from_path
+from pdf2image import convert_from_bytes
+from PIL import Image
 
 import imagedata.formats
+import imagedata.axis
 from imagedata.formats.abstractplugin import AbstractPlugin
-from . import POPPLER_INSTALLED
+from . import poppler_installed
 
 logger = logging.getLogger(__name__)
 
+# Invariant header objects shared by all PDF reads
+_RGB_AXIS = imagedata.axis.VariableAxis('rgb', ['r', 'g', 'b'])
+_ZERO_TAG = np.array([0])
+_ZERO_TAG.setflags(write=False)
+_DEFAULT_POSITION = np.array([0, 0, 0])
+_DEFAULT_POSITION.setflags(write=False)
+_DEFAULT_ORIENTATION = np.array([0, 1, 0, -1, 0, 0])
+_DEFAULT_ORIENTATION.setflags(write=False)
+
 
 class ImageTypeError(Exception):
     """
@@ -68,57 +76,88 @@ class PDFPlugin(AbstractPlugin):
                 si: numpy array (multi-dimensional)
         """
 
-        if not POPPLER_INSTALLED:
+        if not poppler_installed():
             raise OSError("Poppler is not installed")
-        self.dpi = 150  # dpi
-        self.rotate = 0
-        legal_attributes = {'dpi', 'rotate', 'encapsulate'}
+        pdfopt = {
+            'dpi': 200,
+            'rotate': 0,
+            'encapsulate': 'false',
+            'threads': min(8, os.cpu_count() or 1)
+        }
         if 'pdfopt' in opts and opts['pdfopt']:
             for expr in opts['pdfopt'].split(','):
-                attr,value = expr.split('=')
-                if attr in legal_attributes:
-                    setattr(self, attr, value)
-                else:
-                    raise ValueError('Unknown attribute {} set in psopt'.format(attr))
-        self.dpi = int(self.dpi)
-        self.rotate = int(self.rotate)
-        self.encapsulate = self.encapsulate.lower() == 'true' or self.encapsulate.lower() == 'on'
+                attr, sep, value = expr.partition('=')
+                if not sep:
+                    raise ValueError("Missing value in pdfopt expression '{}'".format(expr))
+                if attr not in pdfopt:
+                    raise ValueError("Unknown attribute '{}' set in pdfopt".format(attr))
+                pdfopt[attr] = value
+        self.dpi = int(pdfopt['dpi'])
+        self.rotate = int(pdfopt['rotate'])
+        self.threads = int(pdfopt['threads'])
+        self.encapsulate = pdfopt['encapsulate'].lower() in {'true', 'on'}
         if self.rotate not in {0, 90}:
-            raise ValueError('psopt rotate value {} is not implemented'.format(self.rotate))
+            raise ValueError('pdfopt rotate value {} is not implemented'.format(self.rotate))
+        pdf = f.read()
         if self.encapsulate:
-            ds = self.generate_dicom_from_pdf(f)
+            ds = self.generate_dicom_from_pdf(pdf)
             hdr.DicomHeaderDict = [[(None, None, ds)]]
             hdr.tags = [0]
             hdr.tags[0] = [0]
             return hdr, None
 
         # No PDF encapsulation, convert PDF to bitmaps
-        try:
-            # Convert filename to PNG
-            # self._convert_to_png(f, tempdir, "fname%02d.png")
-            # self._pdf_to_png(f, os.path.join(tempdir.name, "fname.png"))
-            # image_list = convert_from_path(f)
-            image_list = convert_from_bytes(f.read())
-        except imagedata.formats.NotImageError:
-            raise imagedata.formats.NotImageError('{} does not look like a PostScript file'.format(f))
-        if len(image_list) < 1:
-            raise ValueError('No image data read')
-        img = image_list[0]
-        shape = (len(image_list), img.height, img.width, 3)
-        dtype = np.uint8
-        si = np.zeros(shape, dtype)
-        for i, img in enumerate(image_list):
-            logger.debug('read: img {} si {}'.format(img.size, si.size))
-            si[i] = img
+        # Let poppler render the pages to a temporary directory, and load one
+        # page at a time into a pre-allocated array. This avoids keeping
+        # all pages as PIL images in memory together with the numpy array.
+        with tempfile.TemporaryDirectory() as tempdir:
+            try:
+                # Convert filename to PNG
+                # self._convert_to_png(f, tempdir, "fname%02d.png")
+                # self._pdf_to_png(f, os.path.join(tempdir.name, "fname.png"))
+                # image_list = convert_from_path(f)
+                image_list = convert_from_bytes(pdf,
+                                                dpi=self.dpi,
+                                                thread_count=self.threads,
+                                                fmt='ppm',
+                                                use_pdftocairo=False,
+                                                output_folder=tempdir,
+                                                paths_only=True)
+            except imagedata.formats.NotImageError:
+                raise imagedata.formats.NotImageError(
+                    '{} does not look like a PDF file'.format(f))
+            if len(image_list) < 1:
+                raise ValueError('No image data read')
+            with Image.open(image_list[0]) as img:
+                if self.rotate == 90:
+                    shape = (len(image_list), img.width, img.height, 3)
+                else:
+                    shape = (len(image_list), img.height, img.width, 3)
+            dtype = np.uint8
+            si = np.empty(shape, dtype)
+            # Reading is dominated by poppler rendering and PIL decoding (both C),
+            # then a single memcpy per page. The Python overhead per page is
+            # negligible, so a JIT (e.g. Numba) will not help this loop.
+            # Tune with the threads and dpi options instead.
+            for i, fname in enumerate(image_list):
+                with Image.open(fname) as img:
+                    logger.debug('read: img {} si {}'.format(img.size, si.size))
+                    page = np.asarray(img, dtype=dtype)
+                    if self.rotate == 90:
+                        # Rotate while copying, keeping si C-contiguous
+                        page = np.rot90(page)
+                    np.copyto(si[i], page)
+                # Release the decoded page and its rendered file
+                # before the next one is loaded
+                del page
+                os.remove(fname)
         hdr.spacing = (1.0, 1.0, 1.0)
         # Color space: RGB
         hdr.photometricInterpretation = 'RGB'
         hdr.color = True
-        if self.rotate == 90:
-            si = np.rot90(si, axes=(1,2))
         # Let a single page be a 2D image
-        if si.ndim == 3 and si.shape[0] == 1:
-            si.shape = si.shape[1:]
+        if si.ndim == 4 and si.shape[0] == 1:
+            si = si.squeeze(axis=0)
         logger.debug('read: si {}'.format(si.shape))
         return True, si
 
@@ -150,8 +189,8 @@ class PDFPlugin(AbstractPlugin):
         # Default spacing and orientation
         hdr.spacing = (1.0, 1.0, 1.0)
         hdr.imagePositions = {}
-        hdr.imagePositions[0] = np.array([0,0,0])
-        hdr.orientation = np.array([0,1,0,-1,0,0])
+        hdr.imagePositions[0] = _DEFAULT_POSITION
+        hdr.orientation = _DEFAULT_ORIENTATION
 
         # Set tags
         axes = list()
@@ -183,16 +222,10 @@ class PDFPlugin(AbstractPlugin):
                 hdr.spacing[0])
             )
         if _color:
-            axes.append(imagedata.axis.VariableAxis(
-                'rgb',
-                ['r', 'g', 'b'])
-            )
+            axes.append(_RGB_AXIS)
         hdr.axes = axes
 
-        tags = {}
-        for slice in range(nz):
-            tags[slice] = np.array([0])
-        hdr.tags = tags
+        hdr.tags = {slice: _ZERO_TAG for slice in range(nz)}
         return
 
     @staticmethod
@@ -229,9 +262,18 @@ class PDFPlugin(AbstractPlugin):
         img.endpage()
         img.save(outputPath)
         
-    def generate_dicom_from_pdf(self, f):
-        suffix = '.dcm'
-        filename = tempfile.NamedTemporaryFile(suffix=suffix).name
+    def generate_dicom_from_pdf(self, pdf):
+        """Encapsulate PDF document in a DICOM dataset
+
+        Args:
+            self: format plugin instance
+            pdf: PDF document (bytes). An even-length document is used
+                as is, without copying.
+        Returns:
+            ds: pydicom FileDataset
+        """
+        # FileDataset only keeps the filename as metadata
+        filename = 'encapsulated.dcm'
 
         file_meta = Dataset()
         file_meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.104.1'
@@ -246,22 +288,17 @@ class PDFPlugin(AbstractPlugin):
         ds.is_implicit_VR = False
 
         dt = datetime.datetime.now()
-        ds.StudyDate = dt.strftime('%Y%m%d')
-        ds.StudyTime = dt.strftime('%H%M%S.%f')
-        ds.ContentDate = dt.strftime('%Y%m%d')
-        ds.ContentTime = dt.strftime('%H%M%S.%f')
+        ds.StudyDate = ds.ContentDate = dt.strftime('%Y%m%d')
+        ds.StudyTime = ds.ContentTime = dt.strftime('%H%M%S.%f')
         ds.AcquisitionDateTime = '19700101'
         ds.Manufacturer = 'imagedata'
         ds.ReferringPhysicianName = ''
 
         ds.SOPClassUID = '1.2.840.10008.5.1.4.1.1.104.1'
 
-        f_read = f.read()
-        ValueLength = len(f_read)
-        # All Dicom Element must have an even ValueLength
-        if ValueLength % 2 != 0:
-            f_read += b'\0'
-        ds.EncapsulatedDocument = f_read
+        # All Dicom Element must have an even ValueLength.
+        # Only an odd-length document is copied to add the pad byte.
+        ds.EncapsulatedDocument = pdf if len(pdf) % 2 == 0 else pdf + b'\0'
 
         ds.MIMETypeOfEncapsulatedDocument = 'application/pdf'
 
@@ -31,6 +31,8 @@ class Test2DPDFPlugin(unittest.TestCase):
 
         self.opts = parser.parse_args(['--serdes', '1'])
         self.encapsulate_opts = parser.parse_args(['--serdes', '1', '--pdfopt', 'encapsulate=True'])
+        self.rotate_opts = parser.parse_args(['--serdes', '1', '--pdfopt', 'rotate=90'])
+        self.dpi_opts = parser.parse_args(['--serdes', '1', '--pdfopt', 'dpi=100,threads=2'])
 
         plugins = imagedata.formats.get_plugins_list()
         self.pdf_plugin = None
@@ -48,6 +50,20 @@ class Test2DPDFPlugin(unittest.TestCase):
         self.assertEqual(si1.dtype, np.uint8)
         self.assertEqual(si1.shape, (2339, 1653, 3))
 
+    # @unittest.skip("skipping test_read_single_file_rotate")
+    def test_read_single_file_rotate(self):
+        si1 = Series(
+            os.path.join('data', 'pages', 'A_Lovers_Complaint_1.pdf'),
+            'none',
+            self.opts)
+        si2 = Series(
+            os.path.join('data', 'pages', 'A_Lovers_Complaint_1.pdf'),
+            'none',
+            self.rotate_opts)
+        self.assertEqual(si2.dtype, np.uint8)
+        self.assertEqual(si2.shape, (1653, 2339, 3))
+        np.testing.assert_array_equal(np.asarray(si2), np.rot90(np.asarray(si1)))
+
     # @unittest.skip("skipping test_read_two_files")
     def test_read_two_files(self):
         si1 = Series(
@@ -80,6 +96,53 @@ class Test2DPDFPlugin(unittest.TestCase):
         self.assertEqual(si1.dtype, np.uint8)
         self.assertEqual(si1.shape, (6, 2339, 1653, 3))
 
+    # @unittest.skip("skipping test_read_large_file_rotate")
+    def test_read_large_file_rotate(self):
+        si1 = Series(
+            os.path.join('data', 'A_Lovers_Complaint.pdf'),
+            'none',
+            self.opts)
+        si2 = Series(
+            os.path.join('data', 'A_Lovers_Complaint.pdf'),
+            'none',
+            self.rotate_opts)
+        self.assertEqual(si2.dtype, np.uint8)
+        self.assertEqual(si2.shape, (6, 1653, 2339, 3))
+        np.testing.assert_array_equal(np.asarray(si2), np.rot90(np.asarray(si1), axes=(1, 2)))
+
+    # @unittest.skip("skipping test_read_large_file_dpi")
+    def test_read_large_file_dpi(self):
+        si1 = Series(
+            os.path.join('data', 'A_Lovers_Complaint.pdf'),
+            'none',
+            self.dpi_opts)
+        self.assertEqual(si1.dtype, np.uint8)
+        # Half the default 200 dpi
+        self.assertEqual(si1.shape[0], 6)
+        self.assertAlmostEqual(si1.shape[1], 2339 / 2, delta=1)
+        self.assertAlmostEqual(si1.shape[2], 1653 / 2, delta=1)
+        self.assertEqual(si1.shape[3], 3)
+
+    def _read_pdfopt(self, pdfopt):
+        with open(os.path.join('data', 'pages', 'A_Lovers_Complaint_1.pdf'), 'rb') as f:
+            return PDFPlugin()._read_image(f, {'pdfopt': pdfopt}, None)
+
+    # @unittest.skip("skipping test_pdfopt_value_with_equal_sign")
+    def test_pdfopt_value_with_equal_sign(self):
+        # The whole value '9=0' is passed on, and fails the int cast
+        with self.assertRaisesRegex(ValueError, 'invalid literal'):
+            self._read_pdfopt('rotate=9=0')
+
+    # @unittest.skip("skipping test_pdfopt_missing_value")
+    def test_pdfopt_missing_value(self):
+        with self.assertRaisesRegex(ValueError, 'Missing value'):
+            self._read_pdfopt('dpi')
+
+    # @unittest.skip("skipping test_pdfopt_trailing_comma")
+    def test_pdfopt_trailing_comma(self):
+        with self.assertRaisesRegex(ValueError, 'Missing value'):
+            self._read_pdfopt('dpi=100,')
+
     # @unittest.skip("skipping test_zipread_single_file")
     def test_zipread_single_file(self):
         si1 = Series(